@@ -3,6 +3,7 @@ OCR 相關 API 路由
 """
 from typing import List, Dict, Any
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import ORJSONResponse
 from invoice_agent.models.invoice import OCRRequest, OCRBatchRequest, OCRBatchResponse
 from invoice_agent.services.ocr_service import ocr_service
 from invoice_agent.core.logging import logger
@@ -24,13 +25,13 @@ async def extract_text_only(request: OCRRequest):
         # 使用 OCR 服務處理圖像，傳入檔案類型（如果提供）
         result = await ocr_service.extract_text(request.file_url, file_type=request.file_type)
         
-        # 直接返回結果（包含文本、區塊信息和圖像 URL）
-        return result
+        # 直接返回結果（包含文本、區塊信息和圖像 URL），以 orjson 輸出，略過 jsonable_encoder 的逐層轉換
+        return ORJSONResponse(result)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"處理圖像時出錯: {str(e)}")
 
-@router.post("/batch", response_model=OCRBatchResponse)
+@router.post("/batch", responses={200: {"model": OCRBatchResponse}})
 async def extract_batch_text(request: OCRBatchRequest):
     """
     批量處理多個文件，提取文字
@@ -38,14 +39,11 @@ async def extract_batch_text(request: OCRBatchRequest):
     此端點接收多個文件的資訊（包含文件名、MIME類型、大小和連結），使用 OCR 提取文本
     """
     try:
-        # 從請求中提取文件資訊列表
-        files = [file.dict() for file in request.files]
+        # 批量處理所有文件（直接傳入已驗證的文件資訊模型）
+        results = await ocr_service.extract_batch_text(request.files)
         
-        # 批量處理所有文件
-        results = await ocr_service.extract_batch_text(files)
-        
-        # 返回處理結果
-        return OCRBatchResponse(results=results)
+        # 返回處理結果，直接以 orjson 輸出，略過 response_model 的二次驗證
+        return ORJSONResponse({"results": results})
         
     except Exception as e:
         logger.error(f"批量處理文件時出錯: {str(e)}")
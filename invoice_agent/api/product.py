@@ -3,13 +3,14 @@
 """
 from typing import List, Dict, Any
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import Response
 from invoice_agent.models.product import ProductsResponse, ProductCheckRequest, ProductCheckResponse
 from invoice_agent.services.product_service import product_service
 from invoice_agent.core.logging import logger
 
 router = APIRouter(prefix="/products", tags=["Products"])
 
-@router.get("", response_model=ProductsResponse)
+@router.get("", responses={200: {"model": ProductsResponse}})
 async def get_all_products():
     """
     獲取所有產品清單
@@ -18,9 +19,9 @@ async def get_all_products():
         ProductsResponse: 包含所有產品的清單
     """
     try:
-        # 載入並獲取所有產品
-        products = await product_service.get_all_products()
-        return ProductsResponse(products=products, total=len(products))
+        # 直接返回載入時預先序列化的產品清單
+        content = await product_service.get_all_products_json()
+        return Response(content=content, media_type="application/json")
         
     except Exception as e:
         logger.error(f"獲取產品清單時發生錯誤: {str(e)}")
@@ -51,7 +52,7 @@ async def check_product(
             threshold=threshold
         )
         
-        return ProductCheckResponse(
+        return ProductCheckResponse.model_construct(
             exact_match=exact_match,
             matching_products=matching_products
         )
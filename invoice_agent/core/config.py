@@ -1,16 +1,21 @@
-from pydantic import BaseModel
-import os
+from functools import cached_property, lru_cache
 from typing import Optional
 from pathlib import Path
+from pydantic import AliasChoices, Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 # 獲取專案根目錄路徑
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 
-class Settings(BaseModel):
+class Settings(BaseSettings):
     """
-    應用程式設定模型
+    應用程式設定模型，自動從環境變數及 .env 檔案載入
     """
+    # extra="ignore"：.env 中與本應用無關的變數不會導致啟動失敗
+    model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", frozen=True, extra="ignore")
+    
     APP_NAME: str = "Invoice Agent API"
+    VERSION: str = "0.1.0"
     API_V1_PREFIX: str = "/api/v1"
     
     # MongoDB 設定
@@ -19,36 +24,44 @@ class Settings(BaseModel):
     MONGO_HOST: str = "localhost"
     MONGO_PORT: int = 27017
     MONGO_DB: str = "invoice_db"
+    MONGO_MAX_POOL_SIZE: int = 200  # 連線池上限
+    MONGO_MIN_POOL_SIZE: int = 10  # 預先建立並保留的連線數
+    MONGO_MAX_IDLE_TIME_MS: int = 300_000  # 閒置連線的回收時間
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 3000  # 選擇伺服器的逾時時間
     
     # OCR 設定
-    GOOGLE_VISION_CREDENTIALS_PATH: str = str(PROJECT_ROOT / "config" / "vision-credentials.json")
+    GOOGLE_VISION_CREDENTIALS_PATH: str = Field(
+        default=str(PROJECT_ROOT / "config" / "vision-credentials.json"),
+        validation_alias=AliasChoices("GOOGLE_APPLICATION_CREDENTIALS", "GOOGLE_VISION_CREDENTIALS_PATH")
+    )
+    VISION_BATCH_SIZE: int = 16  # 單次 batch_annotate_images 的最大圖像數 (API 上限 16)
+    VISION_BATCH_MAX_WAIT_MS: int = 50  # 合併請求的等待窗口 (毫秒)
+    VISION_BATCH_MAX_MB: int = 8  # 單次 batch_annotate_images 的圖像總大小上限 (MB，API 單次請求上限約 10 MB)
+    VISION_REQUEST_TIMEOUT: float = 30.0  # 單次 batch_annotate_images 呼叫的逾時 (秒)，重試由服務自行處理
+    VISION_MAX_RPS: float = 10.0  # 每個 worker 程序的 Vision API 每秒最大呼叫次數 (0 表示不限制)
+    OCR_MAX_DOWNLOAD_MB: int = 50  # 下載檔案的大小上限 (MB)
+    OCR_BATCH_CONCURRENCY: int = 16  # 批量處理時同時處理的文件數上限
+    OCR_CACHE_SIZE: int = 256  # 以檔案內容雜湊快取的 OCR 結果數量上限 (0 表示停用)
     
-    # 建構 MongoDB 連接 URI
-    @property
+    # 產品資料設定
+    PRODUCTS_CACHE_TTL: int = 300  # 檢查產品檔案是否變更的間隔 (秒)
+    
+    # 建構 MongoDB 連接 URI（設定不可變，只需組合一次）
+    @cached_property
     def MONGO_URI(self) -> str:
         return f"mongodb://{self.MONGO_USER}:{self.MONGO_PASSWORD}@{self.MONGO_HOST}:{self.MONGO_PORT}/{self.MONGO_DB}"
     
     # 其他設定可在此添加
     DEBUG: bool = True
+    WORKERS: int = 0  # uvicorn worker 程序數 (0 表示依 CPU 核心數；DEBUG 模式下固定為 1 以支援自動重新載入)
 
 # 從環境變數加載設定
+@lru_cache(maxsize=1)
 def get_settings() -> Settings:
     """
-    獲取應用程式設定
+    獲取應用程式設定（只建立一次）
     """
-    return Settings(
-        APP_NAME=os.getenv("APP_NAME", "Invoice Agent API"),
-        API_V1_PREFIX=os.getenv("API_V1_PREFIX", "/api/v1"),
-        MONGO_USER=os.getenv("MONGO_USER", "root"),
-        MONGO_PASSWORD=os.getenv("MONGO_PASSWORD", "root"),
-        MONGO_HOST=os.getenv("MONGO_HOST", "localhost"),
-        MONGO_PORT=int(os.getenv("MONGO_PORT", "27017")),
-        MONGO_DB=os.getenv("MONGO_DB", "invoice_db"),
-        GOOGLE_VISION_CREDENTIALS_PATH=os.getenv(
-            "GOOGLE_APPLICATION_CREDENTIALS", 
-            str(PROJECT_ROOT / "config" / "vision-credentials.json")
-        ),
-        DEBUG=os.getenv("DEBUG", "True").lower() in ("true", "1", "t"),
-    )
+    return Settings()
 
+# 模組層級的設定實例於匯入時建立一次；多 worker 部署時每個進程各自建立一次
 settings = get_settings()
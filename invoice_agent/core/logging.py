@@ -2,9 +2,15 @@
 日誌設定模組
 """
 import os
+import queue
 import logging
+import logging.handlers
 import sys
 from pathlib import Path
+from typing import Optional
+
+# 背景日誌監聽器，負責實際寫入控制台與檔案
+log_listener: Optional[logging.handlers.QueueListener] = None
 
 def setup_logging():
     """
@@ -27,15 +33,23 @@ def setup_logging():
     for handler in root_logger.handlers[:]:
         root_logger.removeHandler(handler)
     
-    # 添加控制台處理程序
+    # 建立控制台處理程序
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(formatter)
-    root_logger.addHandler(console_handler)
     
-    # 添加檔案處理程序
+    # 建立檔案處理程序
     file_handler = logging.FileHandler('/app/logs/invoice_agent.log')
     file_handler.setFormatter(formatter)
-    root_logger.addHandler(file_handler)
+    
+    # 根記錄器只寫入佇列，由背景執行緒負責實際的 I/O，避免阻塞事件迴圈
+    global log_listener
+    stop_logging()
+    log_queue = queue.SimpleQueue()
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    log_listener = logging.handlers.QueueListener(
+        log_queue, console_handler, file_handler, respect_handler_level=True
+    )
+    log_listener.start()
     
     # 為特定模組設定日誌級別
     logging.getLogger('uvicorn').setLevel(logging.WARNING)
@@ -43,4 +57,13 @@ def setup_logging():
     
     return root_logger
 
+def stop_logging():
+    """
+    停止背景日誌監聽器，並寫出佇列中剩餘的日誌
+    """
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+
 logger = setup_logging()
@@ -17,9 +17,23 @@ async def connect_to_mongo():
     """
     連接到 MongoDB 資料庫
     """
-    mongo_db.client = AsyncIOMotorClient(settings.MONGO_URI)
+    mongo_db.client = AsyncIOMotorClient(
+        settings.MONGO_URI,
+        maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+        minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=settings.MONGO_MAX_IDLE_TIME_MS,
+        serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        retryWrites=True,
+    )
     mongo_db.db = mongo_db.client[settings.MONGO_DB]
     print(f"已連接到 MongoDB: {settings.MONGO_HOST}:{settings.MONGO_PORT}")
+    
+    # 啟動時先 ping 一次，預先建立連線池，避免首個請求承擔連線握手成本
+    try:
+        await mongo_db.client.admin.command("ping")
+        print("MongoDB 連線池已預熱")
+    except Exception as e:
+        print(f"MongoDB ping 失敗，將於首次使用時再建立連線: {e}")
 
 async def close_mongo_connection():
     """
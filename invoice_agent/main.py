@@ -1,27 +1,50 @@
+from contextlib import asynccontextmanager
+import orjson
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response
 from fastapi.openapi.docs import get_swagger_ui_html, get_redoc_html
 from invoice_agent.api import ocr, product
 from invoice_agent.db.mongodb import connect_to_mongo, close_mongo_connection
-from invoice_agent.core.logging import logger
+from invoice_agent.services.ocr_service import ocr_service
+from invoice_agent.services.product_service import product_service
+from invoice_agent.core.config import settings
+from invoice_agent.core.logging import logger, stop_logging
+
+# 固定內容的響應預先序列化，探針等高頻請求無需每次重新編碼
+ROOT_RESPONSE_BODY = orjson.dumps({"message": "歡迎使用 Invoice Agent API"})
+HEALTH_RESPONSE_BODY = orjson.dumps({"status": "健康", "version": settings.VERSION})
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    應用程式生命週期：啟動時預先建立外部連線，關閉時釋放資源
+    """
+    # 連接 MongoDB 並預熱連線池
+    await connect_to_mongo()
+    # 啟動 OCR 批次佇列並預先建立 Google Vision 客戶端
+    await ocr_service.start()
+    # 啟動時預先載入產品資料並建立查詢索引，避免首個請求承擔載入成本
+    await product_service.load_products()
+    # 預先產生 OpenAPI 文件，讓各模型的 JSON schema 在啟動時建立，而非首次開啟 /docs 時
+    app.openapi()
+    
+    yield
+    
+    await ocr_service.close()
+    await close_mongo_connection()
+    stop_logging()
 
 app = FastAPI(
     title="Invoice Agent API",
     description="API 服務用於處理發票相關操作",
-    version="0.1.0",
+    version=settings.VERSION,
     docs_url=None,  # 自定義文檔 URL
-    redoc_url=None  # 自定義 ReDoc URL
+    redoc_url=None,  # 自定義 ReDoc URL
+    default_response_class=ORJSONResponse,  # 使用 orjson 進行 JSON 序列化
+    lifespan=lifespan
 )
 
-# 註冊啟動和關閉事件
-@app.on_event("startup")
-async def startup():
-    await connect_to_mongo()
-
-@app.on_event("shutdown")
-async def shutdown():
-    await close_mongo_connection()
-
 # 註冊 OCR API 路由
 app.include_router(ocr.router, prefix="/api")
 
@@ -58,8 +81,8 @@ app.add_middleware(
 
 @app.get("/")
 async def root():
-    return {"message": "歡迎使用 Invoice Agent API"}
+    return Response(content=ROOT_RESPONSE_BODY, media_type="application/json")
 
 @app.get("/health")
 async def health_check():
-    return {"status": "健康", "version": "0.1.0"}
\ No newline at end of file
+    return Response(content=HEALTH_RESPONSE_BODY, media_type="application/json")
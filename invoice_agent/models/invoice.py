@@ -25,6 +25,8 @@ class OCRFileInfo(BaseModel):
     mimetype: str
     size: int
     link: str
+    
+    model_config = {"frozen": True}
 
 class OCRBatchRequest(BaseModel):
     """
@@ -54,9 +56,13 @@ class OCRResponse(BaseModel):
     raw_text: str
     file_url: Optional[str]
     # 移除 LLM 相關欄位，OCR 純文字夠用
+    
+    model_config = {"frozen": True}
 
 class OCRBatchResponse(BaseModel):
     """
     OCR 批量響應模型
     """
     results: List[Dict[str, Any]]
+    
+    model_config = {"frozen": True}
@@ -13,6 +13,8 @@ class Product(BaseModel):
     unit: str  # 單位
     currency: str  # 幣別
     price: float = 0.0  # 價格
+    
+    model_config = {"frozen": True}
 
 class ProductMatchResult(BaseModel):
     """
@@ -25,6 +27,8 @@ class ProductMatchResult(BaseModel):
     price: float = 0.0  # 價格
     match_score: float  # 匹配分數 (0-1)
     original_input: str  # 原始輸入的產品名稱
+    
+    model_config = {"frozen": True}
 
 class ProductsResponse(BaseModel):
     """
@@ -32,6 +36,8 @@ class ProductsResponse(BaseModel):
     """
     products: List[Product]
     total: int
+    
+    model_config = {"frozen": True}
 
 class ProductCheckRequest(BaseModel):
     """
@@ -55,6 +61,7 @@ class ProductCheckResponse(BaseModel):
     matching_products: List[ProductMatchResult]  # 匹配的產品清單
     
     model_config = {
+        "frozen": True,
         "json_schema_extra": {
             "example": {
                 "exact_match": False,
@@ -0,0 +1,207 @@
+"""
+OCR 批次佇列 - 將並發的 Vision 請求合併為單一批次呼叫
+"""
+# 標準庫
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple
+
+# 內部模組
+from invoice_agent.core.logging import logger
+
+# 批次處理函式：接收一組請求，依相同順序返回對應的回應
+BatchHandler = Callable[[List[Any]], Awaitable[List[Any]]]
+# 計算單一請求大小 (位元組) 的函式，用於限制單一批次的總大小
+SizeFunc = Callable[[Any], int]
+# 佇列中的項目：請求及其對應的 Future
+QueueItem = Tuple[Any, asyncio.Future]
+
+class AsyncBatchQueue:
+    """
+    非同步批次佇列
+
+    收集在短時間窗口內送達的請求，合併後交由 handler 一次處理，
+    再透過 Future 將結果分送回各個呼叫端
+    """
+
+    def __init__(
+        self,
+        handler: BatchHandler,
+        max_batch_size: int = 16,
+        max_wait: float = 0.05,
+        max_batch_bytes: Optional[int] = None,
+        size_of: Optional[SizeFunc] = None
+    ):
+        """
+        Args:
+            handler: 批次處理函式，例如呼叫 Vision 的 batch_annotate_images
+            max_batch_size: 單一批次的最大請求數 (Vision API 上限為 16)
+            max_wait: 收集批次的最長等待時間 (秒)
+            max_batch_bytes: 單一批次的請求總大小上限 (位元組)，None 表示不限制；
+                單一請求超過上限時仍會單獨成為一個批次
+            size_of: 計算單一請求大小的函式，搭配 max_batch_bytes 使用
+        """
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_batch_bytes = max_batch_bytes
+        self.size_of = size_of
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._dispatch_tasks: Set[asyncio.Task] = set()
+        # 因超出批次大小上限而留待下一批次的請求
+        self._carry: Optional[QueueItem] = None
+
+    def start(self) -> None:
+        """
+        啟動背景批次處理任務（重複呼叫不會建立多個任務）
+        """
+        if self._worker is not None and not self._worker.done():
+            return
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+        logger.info(f"OCR 批次佇列已啟動，批次上限: {self.max_batch_size}，等待窗口: {self.max_wait * 1000:.0f} ms")
+
+    async def stop(self) -> None:
+        """
+        停止背景批次處理任務，尚未處理的請求將收到錯誤
+        """
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+        # 等待已送出的批次完成
+        if self._dispatch_tasks:
+            await asyncio.gather(*self._dispatch_tasks, return_exceptions=True)
+
+        # 通知仍在佇列中的請求
+        pending: List[QueueItem] = []
+        if self._carry is not None:
+            pending.append(self._carry)
+            self._carry = None
+        while self._queue is not None and not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        self._fail_items(pending)
+        logger.info("OCR 批次佇列已停止")
+
+    async def add_request(self, request: Any) -> Any:
+        """
+        加入一個請求並等待其結果
+
+        Args:
+            request: 要交由 handler 處理的單一請求
+
+        Returns:
+            Any: handler 對應此請求的回應
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((request, future))
+        return await future
+
+    async def add_requests(self, requests: List[Any]) -> List[Any]:
+        """
+        一次加入多個請求並等待全部結果
+
+        請求會連續放入佇列，因此會被合併至同一批次（超過批次上限時自動拆分）
+
+        Args:
+            requests: 要交由 handler 處理的請求列表
+
+        Returns:
+            List[Any]: 依請求順序排列的回應，失敗的項目以例外物件返回
+        """
+        self.start()
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in requests]
+        for request, future in zip(requests, futures):
+            self._queue.put_nowait((request, future))
+        return await asyncio.gather(*futures, return_exceptions=True)
+
+    async def _collect_batch(self) -> List[QueueItem]:
+        """
+        等待第一個請求後，在等待窗口內盡量收集更多請求，直到達到數量或大小上限
+        """
+        if self._carry is not None:
+            first, self._carry = self._carry, None
+        else:
+            first = await self._queue.get()
+        batch = [first]
+        batch_bytes = self._request_size(first[0])
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+
+        try:
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+
+                # 超出大小上限的請求留待下一批次，避免單一批次過大導致整批失敗
+                item_bytes = self._request_size(item[0])
+                if self.max_batch_bytes is not None and batch_bytes + item_bytes > self.max_batch_bytes:
+                    self._carry = item
+                    break
+                batch.append(item)
+                batch_bytes += item_bytes
+        except asyncio.CancelledError:
+            # 佇列停止時，已從佇列取出但尚未送出的請求也必須收到錯誤
+            self._fail_items(batch)
+            raise
+
+        return batch
+
+    def _request_size(self, request: Any) -> int:
+        """
+        計算單一請求的大小，未設定 size_of 時為 0
+        """
+        return self.size_of(request) if self.size_of is not None else 0
+
+    @staticmethod
+    def _fail_items(items: List[QueueItem]) -> None:
+        """
+        通知尚未處理的請求佇列已關閉
+        """
+        for _, future in items:
+            if not future.done():
+                future.set_exception(RuntimeError("OCR 批次佇列已關閉"))
+
+    async def _run(self) -> None:
+        """
+        背景任務：持續收集批次並交由 handler 處理
+        """
+        while True:
+            batch = await self._collect_batch()
+            # 在獨立任務中處理批次，以便繼續收集下一批請求
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatch_tasks.add(task)
+            task.add_done_callback(self._dispatch_tasks.discard)
+
+    async def _dispatch(self, batch: List[QueueItem]) -> None:
+        """
+        執行單一批次並將結果分送至各個 Future
+        """
+        requests = [request for request, _ in batch]
+        try:
+            logger.info(f"送出批次請求，共 {len(requests)} 筆")
+            responses = await self.handler(requests)
+            if len(responses) != len(requests):
+                raise RuntimeError(f"批次回應數量不符: 預期 {len(requests)}，實際 {len(responses)}")
+        except Exception as e:
+            logger.error(f"批次請求處理失敗: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), response in zip(batch, responses):
+            if not future.done():
+                future.set_result(response)
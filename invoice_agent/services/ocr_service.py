@@ -3,21 +3,77 @@ OCR 服務 - 負責圖像文字識別
 """
 # 標準庫
 import io
-import os
-import json
+import time
+import asyncio
+import hashlib
 import tempfile
+from collections import OrderedDict
 from typing import Dict, Any, Optional, Tuple, List
 
 # 第三方庫
-import requests
+import httpx
 import pypdf as PyPDF2  # 使用 pypdf 但命名為 PyPDF2 以維持代碼兼容性
-from pdf2image import convert_from_path
-from PIL import Image
+from pdf2image import convert_from_bytes
+from google.api_core import exceptions as google_exceptions
 from google.cloud import vision
-from google.oauth2 import service_account
+from tenacity import (
+    AsyncRetrying,
+    RetryCallState,
+    retry,
+    retry_if_exception,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential,
+)
 
 # 內部模組
 from invoice_agent.core.logging import logger
+from invoice_agent.models.invoice import OCRFileInfo
+from invoice_agent.services.ocr_batch_queue import AsyncBatchQueue
+
+# 下載檔案時每次讀取的區塊大小
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# PDF 以 OCR 處理時最多轉換的頁數
+PDF_OCR_MAX_PAGES = 5
+
+# 處理失敗時返回的訊息
+VISION_FAILURE_TEXT = "OCR 處理失敗，請確認 Google Vision API 憑證是否正確設置。"
+PDF_NO_TEXT_MESSAGE = "無法從 PDF 提取有效文本，請嘗試上傳更清晰的檔案或轉換為圖像格式。"
+PDF_ERROR_PREFIX = "處理 PDF 時出錯: "
+
+# 暫時性錯誤的重試設定：指數退避 (0.5s, 1s, ... 最多 8s)，最多嘗試 3 次
+RETRY_WAIT = wait_exponential(multiplier=0.5, max=8)
+RETRY_STOP = stop_after_attempt(3)
+# 下載時視為暫時性錯誤的 HTTP 狀態碼
+RETRYABLE_HTTP_STATUS = {429, 502, 503, 504}
+# Vision 單張圖像回應中視為暫時性錯誤的 gRPC 狀態碼 (RESOURCE_EXHAUSTED, UNAVAILABLE)
+RETRYABLE_VISION_CODES = {8, 14}
+# Vision 呼叫層級視為暫時性錯誤的例外 (含單次呼叫逾時)
+RETRYABLE_VISION_EXCEPTIONS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+)
+
+class VisionTransientError(Exception):
+    """Vision API 回應中部分圖像發生暫時性錯誤，需要重試"""
+
+def _log_retry(retry_state: RetryCallState) -> None:
+    """
+    重試前記錄錯誤原因與等待時間
+    """
+    logger.warning(
+        f"發生暫時性錯誤: {retry_state.outcome.exception()}，"
+        f"{retry_state.next_action.sleep:.1f} 秒後進行第 {retry_state.attempt_number + 1} 次嘗試"
+    )
+
+def _is_retryable_download_error(error: BaseException) -> bool:
+    """
+    判斷下載錯誤是否為暫時性錯誤 (連線問題或 429/5xx 狀態碼)
+    """
+    if isinstance(error, httpx.TransportError):
+        return True
+    return isinstance(error, httpx.HTTPStatusError) and error.response.status_code in RETRYABLE_HTTP_STATUS
 
 class OCRService:
     """處理圖像 OCR 相關功能"""
@@ -26,6 +82,91 @@ class OCRService:
         # 從配置中獲取 Google Vision API 憑證路徑
         from invoice_agent.core.config import settings
         self.vision_credentials_path = settings.GOOGLE_VISION_CREDENTIALS_PATH
+        self.max_download_bytes = settings.OCR_MAX_DOWNLOAD_MB * 1024 * 1024
+        # 以檔案內容雜湊為鍵的 OCR 結果 LRU 快取，重複提交的檔案不再呼叫 Vision API
+        self.ocr_cache_size = settings.OCR_CACHE_SIZE
+        self._ocr_cache: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        # Vision 請求批次佇列，將並發的 OCR 請求合併為 batch_annotate_images 呼叫
+        self.batch_queue = AsyncBatchQueue(
+            self._batch_annotate_images,
+            max_batch_size=settings.VISION_BATCH_SIZE,
+            max_wait=settings.VISION_BATCH_MAX_WAIT_MS / 1000,
+            max_batch_bytes=settings.VISION_BATCH_MAX_MB * 1024 * 1024,
+            size_of=lambda request: len(request.image.content)
+        )
+        # 限制批量處理時同時進行的文件數，避免超出 Vision API 配額
+        self.batch_semaphore = asyncio.Semaphore(settings.OCR_BATCH_CONCURRENCY)
+        # 簡單的時間間隔限流，確保 Vision API 呼叫頻率不超過設定的每秒請求數
+        self.vision_min_interval = 1 / settings.VISION_MAX_RPS if settings.VISION_MAX_RPS > 0 else 0.0
+        self._last_vision_call = 0.0
+        self._rate_limit_lock = asyncio.Lock()
+        self.vision_request_timeout = settings.VISION_REQUEST_TIMEOUT
+        # Google Vision 非同步客戶端，於應用啟動時建立並重複使用
+        self.vision_client: Optional[vision.ImageAnnotatorAsyncClient] = None
+        # 共用的 HTTP 客戶端，透過連線池重複使用下載連線
+        self.http_client: Optional[httpx.AsyncClient] = None
+        # 每個 Vision 請求共用的語言提示 (支援中文繁體和英文) 與偵測功能設定
+        self._image_context = vision.ImageContext(
+            language_hints=['zh-Hant', 'en'],
+            text_detection_params=vision.TextDetectionParams(
+                enable_text_detection_confidence_score=True
+            )
+        )
+        # 使用 DOCUMENT_TEXT_DETECTION 替代 TEXT_DETECTION，它更適合文檔結構，並提供更詳細的置信度
+        self._vision_features = [vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)]
+    
+    async def start(self) -> None:
+        """
+        啟動 OCR 服務：啟動批次佇列並預先建立 Google Vision 客戶端，
+        避免首個 OCR 請求承擔憑證載入與 gRPC 通道建立的成本
+        """
+        self.batch_queue.start()
+        try:
+            self.get_vision_client()
+        except Exception as e:
+            logger.warning(f"預先建立 Google Vision 客戶端失敗，將於首次 OCR 請求時重試: {e}")
+    
+    async def close(self) -> None:
+        """
+        關閉 OCR 服務：停止批次佇列並關閉 HTTP 及 Google Vision 客戶端
+        """
+        await self.batch_queue.stop()
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+        if self.vision_client is not None:
+            await self.vision_client.transport.close()
+            self.vision_client = None
+            logger.info("Google Vision 客戶端已關閉")
+    
+    def get_http_client(self) -> httpx.AsyncClient:
+        """
+        獲取共用的 HTTP 客戶端，尚未建立時建立
+        
+        Returns:
+            httpx.AsyncClient: 具連線池的 HTTP 客戶端
+        """
+        if self.http_client is None:
+            self.http_client = httpx.AsyncClient(
+                follow_redirects=True,
+                timeout=15,
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16)
+            )
+        return self.http_client
+    
+    def get_vision_client(self) -> vision.ImageAnnotatorAsyncClient:
+        """
+        獲取 Google Vision 非同步客戶端，尚未建立時使用服務帳戶憑證建立
+        
+        Returns:
+            vision.ImageAnnotatorAsyncClient: 共用的 Vision 客戶端
+        """
+        if self.vision_client is None:
+            self.vision_client = vision.ImageAnnotatorAsyncClient.from_service_account_file(
+                self.vision_credentials_path
+            )
+            logger.info("成功使用憑證文件建立 Google Vision 客戶端")
+        return self.vision_client
     
     async def extract_text(self, file_url: str, file_type: str) -> Dict[str, Any]:
         """
@@ -43,38 +184,44 @@ class OCRService:
             logger.info(f"處理 URL: {file_url}")
             
             # 下載檔案
-            content = await self.download_file(file_url)
+            content, content_hash = await self.download_file(file_url)
+            
+            # 相同內容與類型的檔案直接返回快取的 OCR 結果，避免重複呼叫 Vision API
+            cache_key = f"{content_hash}:{file_type}"
+            cached = self._get_cached_result(cache_key)
+            if cached is not None:
+                logger.info("檔案內容與先前處理的檔案相同，使用快取的 OCR 結果")
+                return {**cached, "file_url": file_url}
             
             # 根據檔案類型處理
             if file_type.startswith('image/'):
                 # 影像檔案，直接使用 Google Vision API
                 logger.info("處理為圖像文件，使用 Google Vision API")
-                result = await self.process_image_with_vision(content)
-                # 添加圖像 URL 到結果
-                result["file_url"] = file_url
-                # 返回完整結果而不只是文本
-                return result
+                result, success = await self.process_image_with_vision(content)
                 
             elif file_type == 'application/pdf':
                 # PDF 檔案處理 - 首先檢查是否有文本層，然後決定是否使用 OCR
                 logger.info("處理為 PDF 文件")
-                text_result = await self.process_pdf(content)
-                # 對於 PDF，仍然返回結構化結果，包含 file_url
-                return {"text": text_result, "paragraphs": [], "file_url": file_url}
+                text_result, success = await self.process_pdf(content)
+                # 對於 PDF，仍然返回結構化結果
+                result = {"text": text_result, "paragraphs": []}
             else:
                 # 默認作為圖像處理，也使用 Google Vision API
                 logger.warning(f"未知檔案類型: {file_type}，默認作為圖像處理，使用 Google Vision API")
-                result = await self.process_image_with_vision(content)
-                # 添加圖像 URL 到結果
-                result["file_url"] = file_url
-                return result
+                result, success = await self.process_image_with_vision(content)
+            
+            # 只快取完整成功的結果，部分頁面失敗或 Vision API 錯誤時下次重新處理
+            if success:
+                self._cache_result(cache_key, result)
+            # 添加圖像 URL 到結果，返回完整結果而不只是文本
+            return {**result, "file_url": file_url}
             
         except Exception as e:
             logger.error(f"處理 URL 圖像時發生錯誤: {e}")
             # 返回一些錯誤資訊，以便於調試
             return f"處理錯誤: {str(e)}"
     
-    async def download_file(self, url: str) -> bytes:
+    async def download_file(self, url: str) -> Tuple[bytes, str]:
         """
         從 URL 下載檔案
         
@@ -82,25 +229,88 @@ class OCRService:
             url: 檔案的 URL (Google Drive)
             
         Returns:
-            bytes: 檔案的二進制內容
+            Tuple[bytes, str]: 
+                - 檔案的二進制內容
+                - 檔案內容的 SHA-256 (十六進位字串)
         """
         try:
             logger.info(f"從 URL 下載檔案: {url}")
             
-            # 直接嘗試下載
-            response = requests.get(url, stream=True, timeout=15)
-            response.raise_for_status()  # 確保請求成功
-            
-            logger.info(f"下載成功，檔案大小約: {len(response.content) / 1024:.2f} KB")
-            return response.content
+            content, content_hash = await self._fetch(url)
+            logger.info(f"下載成功，檔案大小約: {len(content) / 1024:.2f} KB")
+            return content, content_hash
                 
         except Exception as e:
             logger.error(f"下載檔案失敗: {e}")
             raise ValueError(f"無法從 URL 下載檔案: {str(e)}")
 
+    @retry(
+        retry=retry_if_exception(_is_retryable_download_error),
+        wait=RETRY_WAIT,
+        stop=RETRY_STOP,
+        before_sleep=_log_retry,
+        reraise=True
+    )
+    async def _fetch(self, url: str) -> Tuple[bytes, str]:
+        """
+        以串流方式下載檔案內容，連線錯誤及 429/5xx 回應會以指數退避重試
+        
+        Args:
+            url: 檔案的 URL
+            
+        Returns:
+            Tuple[bytes, str]: 檔案的二進制內容及其 SHA-256
+        """
+        # 以串流方式分塊下載，並限制檔案大小，避免過大的檔案佔用記憶體
+        # 下載的同時計算雜湊，資料只需經過一次，不必下載完成後再讀取整個檔案
+        chunks = []
+        total_size = 0
+        hasher = hashlib.sha256()
+        async with self.get_http_client().stream("GET", url) as response:
+            response.raise_for_status()  # 確保請求成功
+            
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                total_size += len(chunk)
+                if total_size > self.max_download_bytes:
+                    raise ValueError(f"檔案超過大小上限 {self.max_download_bytes // (1024 * 1024)} MB")
+                hasher.update(chunk)
+                chunks.append(chunk)
+        
+        return b"".join(chunks), hasher.hexdigest()
+
+    def _get_cached_result(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """
+        從 OCR 結果快取中取得結果，命中時將其標記為最近使用
+        
+        Args:
+            cache_key: 檔案內容的 SHA-256 與檔案類型組成的鍵
+            
+        Returns:
+            Optional[Dict[str, Any]]: 快取的結果 (不含 file_url)，未命中時為 None
+        """
+        result = self._ocr_cache.get(cache_key)
+        if result is not None:
+            self._ocr_cache.move_to_end(cache_key)
+        return result
+    
+    def _cache_result(self, cache_key: str, result: Dict[str, Any]) -> None:
+        """
+        將 OCR 結果存入快取，超過容量時移除最久未使用的項目
+        
+        Args:
+            cache_key: 檔案內容的 SHA-256 與檔案類型組成的鍵
+            result: OCR 結果 (不含 file_url)
+        """
+        if self.ocr_cache_size <= 0:
+            return
+        self._ocr_cache[cache_key] = result
+        self._ocr_cache.move_to_end(cache_key)
+        while len(self._ocr_cache) > self.ocr_cache_size:
+            self._ocr_cache.popitem(last=False)
+
     # process_image 函數已移除，我們現在只使用 process_image_with_vision 進行 OCR
     
-    async def process_pdf(self, pdf_data: bytes) -> str:
+    async def process_pdf(self, pdf_data: bytes) -> Tuple[str, bool]:
         """
         處理 PDF 檔案，優先檢查是否所有頁面都有文本層
         只有當所有頁面都有文本層時（all_pages_have_text=True），才直接提取文本
@@ -110,51 +320,49 @@ class OCRService:
             pdf_data: PDF 的二進制數據
             
         Returns:
-            str: 識別出的文字
+            Tuple[str, bool]: 
+                - 識別出的文字，失敗時為錯誤訊息
+                - 是否所有頁面都處理成功
         """
-        temp_path = None
         try:
             logger.info("開始處理 PDF，首先檢查是否有文本層...")
             
-            # 使用臨時文件存儲 PDF
-            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as pdf_file:
-                pdf_file.write(pdf_data)
-                pdf_path = pdf_file.name
-                temp_path = pdf_path
-                logger.info(f"PDF 已保存到臨時文件: {pdf_path}")
-            
             # 嘗試從 PDF 直接提取文本
-            extracted_text_pages, all_pages_have_text = await self._extract_text_from_pdf(pdf_path)
+            extracted_text_pages, all_pages_have_text = await self._extract_text_from_pdf(pdf_data)
             
             # 如果所有頁面都有文本，直接返回
             if all_pages_have_text:
                 logger.info("PDF 所有頁面都有文本層，直接返回提取的文本")
-                return "\n\n".join(extracted_text_pages)
+                return "\n\n".join(extracted_text_pages), True
             
             # 如果不是所有頁面都有文本，使用 OCR 處理
             logger.info("PDF 不是所有頁面都有文本層，使用 OCR 處理...")
-            return await self._process_pdf_with_ocr(pdf_path)
+            return await self._process_pdf_with_ocr(pdf_data)
                 
         except Exception as e:
             logger.error(f"處理 PDF 時發生錯誤: {e}")
             # 返回錯誤資訊
-            return f"處理 PDF 時出錯: {str(e)}"
-        finally:
-            # 清理臨時文件
-            if temp_path and os.path.exists(temp_path):
-                try:
-                    os.unlink(temp_path)
-                    logger.info(f"臨時文件已刪除: {temp_path}")
-                except Exception as e:
-                    logger.error(f"刪除臨時文件時出錯: {e}")
+            return f"{PDF_ERROR_PREFIX}{str(e)}", False
 
-    async def _extract_text_from_pdf(self, pdf_path: str) -> Tuple[List[str], bool]:
+    async def _extract_text_from_pdf(self, pdf_data: bytes) -> Tuple[List[str], bool]:
+        """
+        在執行緒中從 PDF 提取文本層，避免 pypdf 的 CPU 密集運算阻塞事件循環
+        
+        Args:
+            pdf_data: PDF 的二進制數據
+            
+        Returns:
+            Tuple[List[str], bool]: 同 _extract_text_from_pdf_sync
+        """
+        return await asyncio.to_thread(self._extract_text_from_pdf_sync, pdf_data)
+    
+    def _extract_text_from_pdf_sync(self, pdf_data: bytes) -> Tuple[List[str], bool]:
         """
         嘗試使用 PyPDF2 直接從 PDF 提取文本層
         判斷邏輯：只有當所有頁面都有文本時，才認為整篇 PDF 都是文本格式
         
         Args:
-            pdf_path: PDF 檔案的路徑
+            pdf_data: PDF 的二進制數據
             
         Returns:
             Tuple[List[str], bool]: 
@@ -163,30 +371,25 @@ class OCRService:
         """
         try:
             logger.info("嘗試直接從 PDF 提取文本...")
-            with open(pdf_path, 'rb') as pdf_file:
+            with io.BytesIO(pdf_data) as pdf_file:
                 pdf_reader = PyPDF2.PdfReader(pdf_file)
                 
                 # 檢查 PDF 是否有文本層
+                # 只要有一頁沒有足夠的文本就會改用 OCR 處理整個文檔，因此不再提取其餘頁面
+                total_pages = len(pdf_reader.pages)
                 extracted_text_pages = []
                 for i, page in enumerate(pdf_reader.pages):
                     page_text = page.extract_text()
-                    if page_text and len(page_text.strip()) > 50:  # 有足夠的文字
-                        extracted_text_pages.append(page_text)
-                        logger.info(f"從 PDF 第 {i+1} 頁成功提取文本，長度: {len(page_text)}")
-                    else:
-                        logger.info(f"PDF 第 {i+1} 頁沒有足夠的文本，將需要 OCR")
-                
-                # 判斷是否所有頁面都有文本層
-                all_pages_have_text = (
-                    extracted_text_pages and 
-                    len(extracted_text_pages) == len(pdf_reader.pages)  # 確保所有頁面都有文本
-                )
+                    if not page_text or len(page_text.strip()) <= 50:  # 沒有足夠的文字
+                        logger.info(f"PDF 第 {i+1}/{total_pages} 頁沒有足夠的文本層，將使用 OCR 處理整個文檔")
+                        return [], False
+                    extracted_text_pages.append(page_text)
+                    logger.info(f"從 PDF 第 {i+1} 頁成功提取文本，長度: {len(page_text)}")
                 
+                # 確保 PDF 至少有一頁，此時所有頁面都有文本層
+                all_pages_have_text = bool(extracted_text_pages)
                 if all_pages_have_text:
                     logger.info(f"成功從 PDF 所有頁面直接提取文本，共 {len(extracted_text_pages)} 頁")
-                else:
-                    missing_pages = len(pdf_reader.pages) - len(extracted_text_pages)
-                    logger.info(f"PDF 有 {missing_pages}/{len(pdf_reader.pages)} 頁沒有足夠的文本層，將使用 OCR 處理整個文檔")
                 
                 return extracted_text_pages, all_pages_have_text
                 
@@ -194,63 +397,100 @@ class OCRService:
             logger.warning(f"直接從 PDF 提取文本失敗: {extract_error}")
             return [], False
     
-    async def _process_pdf_with_ocr(self, pdf_path: str) -> str:
+    async def _process_pdf_with_ocr(self, pdf_data: bytes) -> Tuple[str, bool]:
         """
         使用 Google Vision API 處理 PDF 文件，將其轉換為文字
         
         Args:
-            pdf_path: PDF 檔案的路徑
+            pdf_data: PDF 的二進制數據
             
         Returns:
-            str: OCR 識別出的文字
+            Tuple[str, bool]: 
+                - OCR 識別出的文字
+                - 是否所有頁面都辨識成功且有提取到文本
         """
         # 使用 pdf2image 將 PDF 轉換為高質量圖像
         logger.info("使用 Google Vision API 處理 PDF...")
         
-        # 轉換 PDF 頁面為圖像
-        images = convert_from_path(
-            pdf_path, 
-            dpi=400,  # 高解析度
-            use_pdftocairo=True,
-            first_page=1,
-            last_page=5,  # 處理前5頁
-            grayscale=False,  # 保留彩色信息
-            transparent=False
-        )
-        logger.info(f"PDF 成功轉換為 {len(images)} 個高質量圖像")
+        # pdftocairo 轉換為阻塞操作，在執行緒中進行以免阻塞事件循環
+        page_images = await asyncio.to_thread(self._render_pdf_pages, pdf_data)
+        
+        # 內容相同的頁面 (例如重複掃描) 只送出一次，結果再對應回各頁
+        unique_images: List[bytes] = []
+        page_slots: List[int] = []
+        seen: Dict[bytes, int] = {}
+        for image_data in page_images:
+            digest = hashlib.blake2b(image_data, digest_size=16).digest()
+            if digest not in seen:
+                seen[digest] = len(unique_images)
+                unique_images.append(image_data)
+            page_slots.append(seen[digest])
+        if len(unique_images) < len(page_images):
+            logger.info(f"PDF 有 {len(page_images) - len(unique_images)} 頁與其他頁面內容相同，不重複進行 OCR")
+        
+        # 一次送出所有頁面，由批次佇列合併為 batch_annotate_images 呼叫
+        unique_results = await self.process_images_with_vision(unique_images)
+        results = [unique_results[slot] for slot in page_slots]
         
-        # 對每個頁面進行 OCR 處理
         all_text = []
-        for i, img in enumerate(images):
-            logger.info(f"處理 PDF 第 {i+1} 頁...")
-            
-            # 將圖像轉換為二進制
-            with io.BytesIO() as img_binary:
-                img.save(img_binary, format='PNG', quality=100)  # 使用最高質量
-                img_binary.seek(0)
-                image_data = img_binary.read()
-            
-            # 使用 Google Vision API
-            try:
-                result = await self.process_image_with_vision(image_data)
-                page_text = result.get("text", "")
-                if page_text and len(page_text.strip()) > 50:  # 確保提取到有意義的文本
-                    all_text.append(page_text)
-                    logger.info(f"第 {i+1} 頁 Vision OCR 完成，文本長度: {len(page_text)}")
-                else:
-                    logger.warning(f"第 {i+1} 頁 Vision OCR 提取文本不足")
-            except Exception as vision_error:
-                logger.error(f"使用 Vision API 處理第 {i+1} 頁時出錯: {vision_error}")
+        all_pages_succeeded = True
+        for i, (result, success) in enumerate(results):
+            if not success:
+                all_pages_succeeded = False
+                logger.warning(f"第 {i+1} 頁 Vision OCR 失敗")
+                continue
+            page_text = result.get("text", "")
+            if page_text and len(page_text.strip()) > 50:  # 確保提取到有意義的文本
+                all_text.append(page_text)
+                logger.info(f"第 {i+1} 頁 Vision OCR 完成，文本長度: {len(page_text)}")
+            else:
+                logger.warning(f"第 {i+1} 頁 Vision OCR 提取文本不足")
         
         # 合併所有頁面的文本
         if all_text:
             result = "\n\n".join(all_text)
             logger.info(f"PDF OCR 處理完成，總文本長度: {len(result)}")
-            return result
+            return result, all_pages_succeeded
         else:
-            return "無法從 PDF 提取有效文本，請嘗試上傳更清晰的檔案或轉換為圖像格式。"
+            return PDF_NO_TEXT_MESSAGE, False
+
+    def _render_pdf_pages(self, pdf_data: bytes) -> List[bytes]:
+        """
+        將 PDF 前幾頁轉換為灰階 JPEG 圖像 (同步執行，供 asyncio.to_thread 呼叫)
+        
+        Args:
+            pdf_data: PDF 的二進制數據
+            
+        Returns:
+            List[bytes]: 各頁 JPEG 圖像的二進制數據
+        """
+        # 直接由 pdftocairo 將頁面輸出為圖像檔案，省去 PIL 解碼與重新編碼
+        # 發票為黑白文件，灰階 JPEG (品質 85) 不影響辨識，但上傳大小遠小於彩色 PNG
+        with tempfile.TemporaryDirectory() as output_dir:
+            page_paths = convert_from_bytes(
+                pdf_data, 
+                dpi=300,  # 300 DPI 已足夠 Vision API 辨識
+                output_folder=output_dir,
+                fmt="jpeg",
+                jpegopt={"quality": 85, "optimize": True},
+                paths_only=True,
+                use_pdftocairo=True,
+                first_page=1,
+                last_page=PDF_OCR_MAX_PAGES,  # 處理前5頁
+                grayscale=True,
+                transparent=False
+            )
+            logger.info(f"PDF 成功轉換為 {len(page_paths)} 個 JPEG 圖像")
+            
+            # 讀取已編碼的頁面圖像
+            page_images = []
+            for page_path in page_paths:
+                with open(page_path, "rb") as f:
+                    page_images.append(f.read())
+        
+        return page_images
 
-    async def process_image_with_vision(self, image_data: bytes) -> Dict[str, Any]:
+    async def process_image_with_vision(self, image_data: bytes) -> Tuple[Dict[str, Any], bool]:
         """
         使用 Google Vision API 處理圖像進行 OCR
         
@@ -258,7 +498,11 @@ class OCRService:
             image_data: 圖像的二進制數據
             
         Returns:
-            Dict[str, Any]: 包含文字和詳細信息的字典，結構:
+            Tuple[Dict[str, Any], bool]: 
+                - 包含文字和詳細信息的字典，失敗時為 _vision_failure_result
+                - 是否辨識成功
+            
+            字典結構:
             {
                 "text": "識別的完整文字",
                 "width": 圖像寬度,
@@ -281,242 +525,366 @@ class OCRService:
         try:
             logger.info("使用 Google Vision API 進行 OCR 處理...")
             
-            # 使用來自配置的憑證路徑
-            credentials_path = self.vision_credentials_path
-
-            # 使用服務帳戶憑證
-            credentials = service_account.Credentials.from_service_account_file(credentials_path)
-            client = vision.ImageAnnotatorClient(credentials=credentials)
-            logger.info("成功使用憑證文件建立 Google Vision 客戶端")
-                
-            # 創建 vision API 圖像
-            image = vision.Image(content=image_data)
-            
-            # 配置語言提示 (支援中文繁體和英文)
-            image_context = vision.ImageContext(
-                language_hints=['zh-Hant', 'en'],
-                text_detection_params=vision.TextDetectionParams(
-                    enable_text_detection_confidence_score=True
-                )
-            )
+            request = self._build_vision_request(image_data)
             
-            # 使用 document_text_detection 替代 text_detection，它更適合文檔結構，並提供更詳細的置信度
-            response = client.document_text_detection(image=image, image_context=image_context)
+            # 透過批次佇列送出，與其他並發請求合併為單一 API 呼叫
+            response = await self.batch_queue.add_request(request)
             
-            # 檢查錯誤
-            if response.error.message:
-                raise Exception(f"Vision API 錯誤: {response.error.message}")
+            return self._parse_vision_response(response), True
             
-            # 提取完整文本
-            full_text = response.text_annotations[0].description if response.text_annotations else ""
+        except Exception as e:
+            logger.error(f"Google Vision API 調用失敗: {e}")
+            return self._vision_failure_result(), False
+
+    async def process_images_with_vision(self, images: List[bytes]) -> List[Tuple[Dict[str, Any], bool]]:
+        """
+        使用 Google Vision API 一次處理多張圖像，請求會一併送入批次佇列，
+        以 batch_annotate_images 合併為盡量少的 API 呼叫 (每次最多 VISION_BATCH_SIZE 張)
+        
+        Args:
+            images: 圖像的二進制數據列表
             
-            # 記錄結果
-            logger.info(f"Google Vision API 成功提取文本，長度: {len(full_text)}")
+        Returns:
+            List[Tuple[Dict[str, Any], bool]]: 與輸入順序相同的 (結果, 是否成功) 列表，結構同 process_image_with_vision
+        """
+        logger.info(f"使用 Google Vision API 批次處理 {len(images)} 張圖像...")
+        
+        requests = [self._build_vision_request(image_data) for image_data in images]
+        responses = await self.batch_queue.add_requests(requests)
+        
+        results = []
+        for i, response in enumerate(responses):
+            try:
+                if isinstance(response, BaseException):
+                    raise response
+                results.append((self._parse_vision_response(response), True))
+            except Exception as e:
+                logger.error(f"Google Vision API 處理第 {i+1} 張圖像失敗: {e}")
+                results.append((self._vision_failure_result(), False))
+        
+        return results
+
+    def _build_vision_request(self, image_data: bytes) -> vision.AnnotateImageRequest:
+        """
+        建立單張圖像的 Vision API 請求
+        
+        Args:
+            image_data: 圖像的二進制數據
             
-            # 創建結果字典 - 主要返回 paragraph 層級的結果
-            result = {
-                "text": full_text,
-                "width": 0,
-                "height": 0,
-                "paragraphs": []   # 以段落作為主要返回層級
-            }
+        Returns:
+            vision.AnnotateImageRequest: 使用 DOCUMENT_TEXT_DETECTION 的請求
+        """
+        # 創建 vision API 圖像
+        image = vision.Image(content=image_data)
+        # 語言提示與偵測功能設定於初始化時建立，所有請求共用
+        request = vision.AnnotateImageRequest(
+            image=image,
+            features=self._vision_features,
+            image_context=self._image_context
+        )
+        return request
+
+    def _parse_vision_response(self, response: vision.AnnotateImageResponse) -> Dict[str, Any]:
+        """
+        將 Vision API 回應轉換為結果字典，結構說明見 process_image_with_vision
+        
+        Args:
+            response: 單張圖像的 Vision API 回應
+        
+        Returns:
+            Dict[str, Any]: 包含文字和詳細信息的字典
+        """
+        # 檢查錯誤
+        if response.error.message:
+            raise Exception(f"Vision API 錯誤: {response.error.message}")
+        
+        # 提取完整文本
+        full_text = response.text_annotations[0].description if response.text_annotations else ""
+        
+        # 記錄結果
+        logger.info(f"Google Vision API 成功提取文本，長度: {len(full_text)}")
+        
+        # 創建結果字典 - 主要返回 paragraph 層級的結果
+        result = {
+            "text": full_text,
+            "width": 0,
+            "height": 0,
+            "paragraphs": []   # 以段落作為主要返回層級
+        }
+        
+        # 如果有完整的文本註釋
+        if response.full_text_annotation and response.full_text_annotation.pages:
+            # 獲取頁面大小
+            page = response.full_text_annotation.pages[0]  # 僅處理第一頁
+            result["width"] = page.width
+            result["height"] = page.height
             
-            # 如果有完整的文本註釋
-            if response.full_text_annotation and response.full_text_annotation.pages:
-                # 獲取頁面大小
-                page = response.full_text_annotation.pages[0]  # 僅處理第一頁
-                result["width"] = page.width
-                result["height"] = page.height
+            # 處理詳細的文本區塊
+            try:
+                # 從完整的文本註釋中提取段落
+                paragraph_count = 0
                 
-                # 處理詳細的文本區塊
-                try:
-                    # 從完整的文本註釋中提取段落
-                    paragraph_count = 0
-                    
-                    # 檢查頁面中是否有 blocks 屬性
-                    if hasattr(page, 'blocks') and page.blocks:
-                        blocks = page.blocks
-                    else:
-                        # 如果沒有 blocks 屬性，嘗試使用 text_annotations
-                        logger.warning("頁面沒有 blocks 屬性，改用 text_annotations")
-                        blocks = []
+                # 檢查頁面中是否有 blocks 屬性
+                if hasattr(page, 'blocks') and page.blocks:
+                    blocks = page.blocks
+                else:
+                    # 如果沒有 blocks 屬性，嘗試使用 text_annotations
+                    logger.warning("頁面沒有 blocks 屬性，改用 text_annotations")
+                    blocks = []
+                
+                for block in blocks:
+                    block_id = block.block_type if hasattr(block, 'block_type') else "UNKNOWN"
                     
-                    for block in blocks:
-                        block_id = block.block_type if hasattr(block, 'block_type') else "UNKNOWN"
+                    # 提取段落文本
+                    for paragraph in block.paragraphs:
+                        paragraph_count += 1
+                        
+                        # 使用段落的置信度（如果有）
+                        paragraph_confidence = paragraph.confidence if hasattr(paragraph, 'confidence') and paragraph.confidence else 0.0
+                        
+                        # 提取單詞文本以構建段落文本 (以 join 一次組合，避免逐字串接)
+                        paragraph_text = ''.join(
+                            symbol.text for word in paragraph.words for symbol in word.symbols
+                        )
                         
-                        # 提取段落文本
-                        for paragraph in block.paragraphs:
-                            paragraph_count += 1
-                            paragraph_text = ""
+                        # 添加此段落的信息
+                        if paragraph.bounding_box:
+                            # 獲取頂點座標 (只讀取一次 protobuf 欄位)
+                            vertices = paragraph.bounding_box.vertices
+                            xs = [vertex.x for vertex in vertices]
+                            ys = [vertex.y for vertex in vertices]
                             
-                            # 使用段落的置信度（如果有）
-                            paragraph_confidence = paragraph.confidence if hasattr(paragraph, 'confidence') and paragraph.confidence else 0.0
+                            # 計算 top、left、width、height
+                            # 找出最小的 x、y 和最大的 x、y 來計算邊界框
+                            left = min(xs)
+                            top = min(ys)
+                            right = max(xs)
+                            bottom = max(ys)
+                            width = right - left
+                            height = bottom - top
                             
-                            # 提取單詞文本以構建段落文本
-                            for word in paragraph.words:
-                                word_text = ''.join([symbol.text for symbol in word.symbols])
-                                paragraph_text += word_text
+                            # 將座標轉換為整數
+                            left = int(left)
+                            top = int(top)
+                            width = int(width)
+                            height = int(height)
                             
-                            # 添加此段落的信息
-                            if paragraph.bounding_box:
-                                # 獲取頂點座標
-                                vertices = paragraph.bounding_box.vertices
-                                
-                                # 計算 top、left、width、height
-                                # 找出最小的 x、y 和最大的 x、y 來計算邊界框
-                                left = min(vertex.x for vertex in vertices)
-                                top = min(vertex.y for vertex in vertices)
-                                right = max(vertex.x for vertex in vertices)
-                                bottom = max(vertex.y for vertex in vertices)
-                                width = right - left
-                                height = bottom - top
-                                
-                                # 將座標轉換為整數
-                                left = int(left)
-                                top = int(top)
-                                width = int(width)
-                                height = int(height)
-                                
-                                # 將段落置信度轉換為百分比
-                                paragraph_confidence_percent = round(paragraph_confidence * 100, 2) if paragraph_confidence > 0 else 0
-                                
-                                result["paragraphs"].append({
-                                    "text": paragraph_text.strip(),
-                                    "location": {
-                                        "top": top,
-                                        "left": left,
-                                        "width": width,
-                                        "height": height
-                                    },
-                                    "confidence": paragraph_confidence_percent,
-                                    "paragraph_id": paragraph_count,
-                                    "block_type": str(block_id)
-                                })
-                except Exception as block_error:
-                    logger.warning(f"提取詳細區塊信息時出錯: {block_error}")
-            
-            # 如果沒有從 full_text_annotation 獲得段落信息，則從 text_annotations 獲取
-            if not result["paragraphs"] and len(response.text_annotations) > 1:
-                # 跳過第一個（它是完整文本），提取其餘的文本區塊
-                paragraph_count = 0
-                for text_annotation in response.text_annotations[1:]:
-                    paragraph_count += 1
-                    
-                    # 檢查是否有邊界框
-                    if not hasattr(text_annotation, 'bounding_poly') or not text_annotation.bounding_poly:
-                        continue
-                    
-                    # 獲取頂點座標
-                    vertices = text_annotation.bounding_poly.vertices
-                    
-                    # 計算 top、left、width、height
-                    left = min(vertex.x for vertex in vertices)
-                    top = min(vertex.y for vertex in vertices)
-                    right = max(vertex.x for vertex in vertices)
-                    bottom = max(vertex.y for vertex in vertices)
-                    width = right - left
-                    height = bottom - top
-                    
-                    # 將座標轉換為整數
-                    left = int(left)
-                    top = int(top)
-                    width = int(width)
-                    height = int(height)
-                    
-                    # 獲取置信度（如果有）
-                    confidence = 0.0
-                    if hasattr(text_annotation, 'confidence') and text_annotation.confidence:
-                        confidence = text_annotation.confidence
-                    
-                    # 將置信度轉換為百分比
-                    confidence_percent = round(confidence * 100, 2) if confidence > 0 else 0
-                    
-                    result["paragraphs"].append({
-                        "text": text_annotation.description,
-                        "location": {
-                            "top": top,
-                            "left": left,
-                            "width": width,
-                            "height": height
-                        },
-                        "confidence": confidence_percent,
-                        "paragraph_id": paragraph_count,
-                        "block_type": "TEXT_ANNOTATION"
-                    })
-            
-            return result
+                            # 將段落置信度轉換為百分比
+                            paragraph_confidence_percent = round(paragraph_confidence * 100, 2) if paragraph_confidence > 0 else 0
+                            
+                            result["paragraphs"].append({
+                                "text": paragraph_text.strip(),
+                                "location": {
+                                    "top": top,
+                                    "left": left,
+                                    "width": width,
+                                    "height": height
+                                },
+                                "confidence": paragraph_confidence_percent,
+                                "paragraph_id": paragraph_count,
+                                "block_type": str(block_id)
+                            })
+            except Exception as block_error:
+                logger.warning(f"提取詳細區塊信息時出錯: {block_error}")
+        
+        # 如果沒有從 full_text_annotation 獲得段落信息，則從 text_annotations 獲取
+        if not result["paragraphs"] and len(response.text_annotations) > 1:
+            # 跳過第一個（它是完整文本），提取其餘的文本區塊
+            paragraph_count = 0
+            for text_annotation in response.text_annotations[1:]:
+                paragraph_count += 1
+                
+                # 檢查是否有邊界框
+                if not hasattr(text_annotation, 'bounding_poly') or not text_annotation.bounding_poly:
+                    continue
+                
+                # 獲取頂點座標 (只讀取一次 protobuf 欄位)
+                vertices = text_annotation.bounding_poly.vertices
+                xs = [vertex.x for vertex in vertices]
+                ys = [vertex.y for vertex in vertices]
+                
+                # 計算 top、left、width、height
+                left = min(xs)
+                top = min(ys)
+                right = max(xs)
+                bottom = max(ys)
+                width = right - left
+                height = bottom - top
+                
+                # 將座標轉換為整數
+                left = int(left)
+                top = int(top)
+                width = int(width)
+                height = int(height)
+                
+                # 獲取置信度（如果有）
+                confidence = 0.0
+                if hasattr(text_annotation, 'confidence') and text_annotation.confidence:
+                    confidence = text_annotation.confidence
+                
+                # 將置信度轉換為百分比
+                confidence_percent = round(confidence * 100, 2) if confidence > 0 else 0
+                
+                result["paragraphs"].append({
+                    "text": text_annotation.description,
+                    "location": {
+                        "top": top,
+                        "left": left,
+                        "width": width,
+                        "height": height
+                    },
+                    "confidence": confidence_percent,
+                    "paragraph_id": paragraph_count,
+                    "block_type": "TEXT_ANNOTATION"
+                })
+        
+        return result
+
+    @staticmethod
+    def _vision_failure_result() -> Dict[str, Any]:
+        """
+        Vision API 處理失敗時返回的結果
+        """
+        return {
+            "text": VISION_FAILURE_TEXT,
+            "width": 0,
+            "height": 0,
+            "paragraphs": []
+        }
+
+    async def _batch_annotate_images(self, requests: List[vision.AnnotateImageRequest]) -> List[vision.AnnotateImageResponse]:
+        """
+        使用 batch_annotate_images 一次處理多個圖像請求
+        
+        Args:
+            requests: Vision API 圖像請求列表
             
-        except Exception as e:
-            logger.error(f"Google Vision API 調用失敗: {e}")
-            return {
-                "text": "OCR 處理失敗，請確認 Google Vision API 憑證是否正確設置。",
-                "width": 0,
-                "height": 0,
-                "paragraphs": []
-            }
+        Returns:
+            List[vision.AnnotateImageResponse]: 與請求順序相同的回應列表
+        """
+        client = self.get_vision_client()
+        responses: List[Optional[vision.AnnotateImageResponse]] = [None] * len(requests)
+        pending = list(range(len(requests)))
+        
+        # 配額不足或服務暫時不可用時以指數退避重試；單張圖像的暫時性錯誤只重送該圖像
+        try:
+            async for attempt in AsyncRetrying(
+                retry=retry_if_exception_type(RETRYABLE_VISION_EXCEPTIONS + (VisionTransientError,)),
+                wait=RETRY_WAIT,
+                stop=RETRY_STOP,
+                before_sleep=_log_retry,
+                reraise=True
+            ):
+                with attempt:
+                    await self._wait_for_rate_limit()
+                    # 停用客戶端內建的重試 (預設最長 600 秒)，只由此處的重試控制次數，並限制每次呼叫的時間
+                    response = await client.batch_annotate_images(
+                        requests=[requests[i] for i in pending],
+                        retry=None,
+                        timeout=self.vision_request_timeout
+                    )
+                    for i, image_response in zip(pending, response.responses):
+                        responses[i] = image_response
+                    pending = [i for i in pending if responses[i].error.code in RETRYABLE_VISION_CODES]
+                    if pending:
+                        raise VisionTransientError(f"{len(pending)} 張圖像發生暫時性錯誤")
+        except VisionTransientError as e:
+            # 重試次數用盡，保留錯誤回應交由各請求自行處理
+            logger.error(f"Vision API 重試後仍失敗: {e}")
+        
+        return responses
 
-    async def extract_batch_text(self, files: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    async def _wait_for_rate_limit(self) -> None:
+        """
+        等待至距離上次 Vision API 呼叫已超過最小間隔
         """
-        處理多個文件進行 OCR
+        if self.vision_min_interval <= 0:
+            return
+        
+        async with self._rate_limit_lock:
+            wait_time = self._last_vision_call + self.vision_min_interval - time.monotonic()
+            if wait_time > 0:
+                await asyncio.sleep(wait_time)
+            self._last_vision_call = time.monotonic()
+
+    async def extract_batch_text(self, files: List[OCRFileInfo]) -> List[Dict[str, Any]]:
+        """
+        處理多個文件進行 OCR，各文件並發處理
         
         Args:
-            files: 文件資訊列表，每個元素應包含 filename, mimetype, size, link
+            files: 文件資訊列表，每個元素包含 filename, mimetype, size, link
             
         Returns:
-            List[Dict[str, Any]]: 每個文件的處理結果清單
+            List[Dict[str, Any]]: 每個文件的處理結果清單，順序與輸入相同
         """
         logger.info(f"===================== 開始批量處理 {len(files)} 個文件 =====================")
         
-        results = []
+        # 各文件互不相依，並發處理；單一文件失敗不影響其他文件
+        outcomes = await asyncio.gather(
+            *(self._extract_file_text(file_info) for file_info in files),
+            return_exceptions=True
+        )
         
-        for file_info in files:
-            try:
-                file_url = file_info.get("link")
-                file_type = file_info.get("mimetype")
-                filename = file_info.get("filename")
-                
-                logger.info(f"處理文件: {filename} ({file_type})")
-                
-                # 使用現有的 extract_text 方法處理每個文件
-                result = await self.extract_text(file_url, file_type)
-                
-                # 獲取文本和其他信息
-                if isinstance(result, dict):
-                    text = result.get("text", "")
-                    # 複製結果並添加文件信息
-                    file_result = result.copy()
-                    file_result.update({
-                        "filename": filename,
-                        "mimetype": file_type,
-                        "success": True,
-                        "file_url": file_url
-                    })
-                    results.append(file_result)
-                else:
-                    # 兼容舊的純文本結果
-                    results.append({
-                        "filename": filename,
-                        "mimetype": file_type,
-                        "text": result,
-                        "success": True,
-                        "file_url": file_url
-                    })
-                
-            except Exception as e:
-                logger.error(f"處理文件 {file_info.get('filename')} 時出錯: {e}")
+        results = []
+        for file_info, outcome in zip(files, outcomes):
+            if isinstance(outcome, BaseException):
+                logger.error(f"處理文件 {file_info.filename} 時出錯: {outcome}")
                 
                 # 即使發生錯誤，也添加到結果中
                 results.append({
-                    "filename": file_info.get("filename"),
-                    "mimetype": file_info.get("mimetype"),
-                    "text": f"處理錯誤: {str(e)}",
+                    "filename": file_info.filename,
+                    "mimetype": file_info.mimetype,
+                    "text": f"處理錯誤: {str(outcome)}",
                     "success": False,
-                    "error": str(e)
+                    "error": str(outcome)
                 })
+            else:
+                results.append(outcome)
         
         logger.info(f"批量處理完成，成功: {sum(1 for r in results if r.get('success', False))}/{len(results)}")
         
         return results
+    
+    async def _extract_file_text(self, file_info: OCRFileInfo) -> Dict[str, Any]:
+        """
+        處理批量請求中的單一文件，並以信號量限制同時處理的文件數
+        
+        Args:
+            file_info: 文件資訊
+            
+        Returns:
+            Dict[str, Any]: 包含文件資訊的處理結果
+        """
+        file_url = file_info.link
+        file_type = file_info.mimetype
+        filename = file_info.filename
+        
+        async with self.batch_semaphore:
+            logger.info(f"處理文件: {filename} ({file_type})")
+            
+            # 使用現有的 extract_text 方法處理每個文件
+            result = await self.extract_text(file_url, file_type)
+        
+        # 獲取文本和其他信息
+        if isinstance(result, dict):
+            # 複製結果並添加文件信息
+            file_result = result.copy()
+            file_result.update({
+                "filename": filename,
+                "mimetype": file_type,
+                "success": True,
+                "file_url": file_url
+            })
+            return file_result
+        
+        # 兼容舊的純文本結果
+        return {
+            "filename": filename,
+            "mimetype": file_type,
+            "text": result,
+            "success": True,
+            "file_url": file_url
+        }
 
 # 服務單例
 ocr_service = OCRService()
@@ -3,20 +3,34 @@
 """
 import os
 import csv
+import time
 import asyncio
-from typing import List, Dict, Any, Tuple
-from rapidfuzz import fuzz
+from typing import List, Dict, Any, Tuple, Optional
+import numpy as np
+import orjson
+from pydantic import TypeAdapter
+from rapidfuzz import fuzz, process
 from invoice_agent.models.product import Product, ProductMatchResult
+from invoice_agent.core.config import settings
 from invoice_agent.core.logging import logger
 
+# 批次驗證產品資料列用的型別轉接器
+PRODUCT_LIST_ADAPTER = TypeAdapter(List[Product])
+
 class ProductService:
     """處理產品資料和比對相關功能"""
     
     def __init__(self):
         self.products: List[Product] = []
-        self.products_dict: Dict[str, Product] = {}  # 以產品 ID 為鍵的字典
-        self.products_name_dict: Dict[str, Product] = {}  # 以產品名稱為鍵的字典
+        self.product_names: List[str] = []  # 與 products 順序相同的產品名稱
+        self.normalized_names: List[str] = []  # 標準化 (去除空白、忽略大小寫) 後的產品名稱，供批次比對使用
+        self._name_index: Dict[str, int] = {}  # 以標準化產品名稱為鍵的產品索引，供完全匹配使用
         self.products_loaded = False
+        # 預先序列化的產品清單響應；尚未成功載入時與先前相同，返回空清單
+        self.products_json: bytes = orjson.dumps({"products": [], "total": 0})
+        self._source_signature: Optional[Tuple[int, int]] = None  # 產品檔案的 (修改時間, 大小)
+        self._last_checked = 0.0  # 上次檢查產品檔案是否變更的時間
+        self._reload_lock = asyncio.Lock()
         # 使用相對路徑，使其在任何環境中都能正常工作
         # 在容器內會是 /app/products_list.csv，在本地會是 products_list.csv
         self.products_file_path = os.path.join(os.getcwd(), "products_list.csv")
@@ -35,35 +49,29 @@ class ProductService:
                 logger.error(f"產品資料檔案不存在：{self.products_file_path}")
                 return False
             
-            # 清空產品資料
-            self.products = []
-            self.products_dict = {}
-            self.products_name_dict = {}
+            # 記錄檔案簽章，用於判斷之後是否需要重新載入
+            stat = os.stat(self.products_file_path)
+            signature = (stat.st_mtime_ns, stat.st_size)
             
-            # 讀取 CSV 檔案
-            with open(self.products_file_path, 'r', encoding='utf-8-sig') as file:
-                reader = csv.reader(file)
-                # 跳過標題行
-                headers = next(reader)
-                
-                # 檢查標題行格式是否正確
-                if len(headers) < 5 or '品號' not in headers[0] or '品名' not in headers[1] or '價格' not in headers[4]:
-                    logger.error(f"產品資料檔案格式不正確，標題行：{headers}")
-                    return False
-                
-                # 讀取產品資料
-                for row in reader:
-                    product = Product(
-                        product_id=row[0],
-                        name=row[1],
-                        unit=row[2],
-                        currency=row[3],
-                        price=row[4],
-                    )
-                    
-                    self.products.append(product)
-                    self.products_dict[product.product_id] = product
-                    self.products_name_dict[product.name] = product
+            # 先載入到區域變數，成功後再一次替換，避免載入失敗時留下不完整的資料
+            products = self._read_products_csv()
+            if products is None:
+                return False
+            
+            # 預先序列化產品清單，/products 端點可直接返回
+            products_json = orjson.dumps({
+                "products": [product.model_dump() for product in products],
+                "total": len(products)
+            })
+            
+            self.products = products
+            self.product_names = [product.name for product in products]
+            # 預先標準化產品名稱，每次比對只需標準化輸入名稱
+            self.normalized_names = [self._normalize_name(name) for name in self.product_names]
+            self._name_index = {name: i for i, name in enumerate(self.normalized_names)}
+            self.products_json = products_json
+            self._source_signature = signature
+            self._last_checked = time.monotonic()
             
             logger.info(f"成功載入 {len(self.products)} 筆產品資料")
             self.products_loaded = True
@@ -73,6 +81,72 @@ class ProductService:
             logger.error(f"載入產品資料時發生錯誤：{str(e)}")
             return False
     
+    def _read_products_csv(self) -> Optional[List[Product]]:
+        """
+        讀取並解析產品資料 CSV 檔案
+        
+        Returns:
+            Optional[List[Product]]: 產品清單，檔案格式不正確時為 None
+        """
+        rows: List[Dict[str, str]] = []
+        
+        # 讀取 CSV 檔案
+        with open(self.products_file_path, 'r', encoding='utf-8-sig') as file:
+            reader = csv.reader(file)
+            # 跳過標題行
+            headers = next(reader)
+            
+            # 檢查標題行格式是否正確
+            if len(headers) < 5 or '品號' not in headers[0] or '品名' not in headers[1] or '價格' not in headers[4]:
+                logger.error(f"產品資料檔案格式不正確，標題行：{headers}")
+                return None
+            
+            # 讀取產品資料
+            for row in reader:
+                # 跳過空白行（例如檔案結尾的 ",,,,"）
+                if not any(cell.strip() for cell in row):
+                    continue
+                
+                rows.append({
+                    "product_id": row[0],
+                    "name": row[1],
+                    "unit": row[2],
+                    "currency": row[3],
+                    "price": row[4],
+                })
+        
+        # 一次驗證所有資料列，由 pydantic-core 批次建立 Product，省去逐筆建構的 Python 開銷
+        products = PRODUCT_LIST_ADAPTER.validate_python(rows)
+        return products
+    
+    async def ensure_products_loaded(self) -> None:
+        """
+        確保產品資料已載入且為最新版本
+        
+        每隔 PRODUCTS_CACHE_TTL 秒檢查一次產品檔案的修改時間與大小，有變更時才重新載入
+        """
+        if self.products_loaded and time.monotonic() - self._last_checked < settings.PRODUCTS_CACHE_TTL:
+            return
+        
+        async with self._reload_lock:
+            if not self.products_loaded:
+                await self.load_products()
+                return
+            
+            if time.monotonic() - self._last_checked < settings.PRODUCTS_CACHE_TTL:
+                return
+            
+            self._last_checked = time.monotonic()
+            try:
+                stat = os.stat(self.products_file_path)
+            except OSError as e:
+                logger.warning(f"無法檢查產品資料檔案，繼續使用快取資料：{e}")
+                return
+            
+            if (stat.st_mtime_ns, stat.st_size) != self._source_signature:
+                logger.info("產品資料檔案已變更，重新載入")
+                await self.load_products()
+    
     async def get_all_products(self) -> List[Product]:
         """
         獲取所有產品
@@ -80,11 +154,21 @@ class ProductService:
         Returns:
             List[Product]: 所有產品清單
         """
-        if not self.products_loaded:
-            await self.load_products()
+        await self.ensure_products_loaded()
         
         return self.products
     
+    async def get_all_products_json(self) -> bytes:
+        """
+        獲取預先序列化的所有產品清單
+        
+        Returns:
+            bytes: 產品清單響應的 JSON 內容，格式同 ProductsResponse
+        """
+        await self.ensure_products_loaded()
+        
+        return self.products_json
+    
     async def check_product(self, product_name: str, max_results: int = 5, threshold: float = 0.4) -> Tuple[bool, List[ProductMatchResult]]:
         """
         檢查產品是否存在，若不存在則返回最接近的產品
@@ -99,23 +183,22 @@ class ProductService:
                 - 是否有完全匹配
                 - 匹配的產品清單
         """
-        if not self.products_loaded:
-            await self.load_products()
+        await self.ensure_products_loaded()
         
         # 如果產品名稱為空，返回空結果
         if not product_name or not product_name.strip():
             return False, []
         
-        # 標準化產品名稱 (去除空白)
-        normalized_name = product_name.strip()
+        # 標準化產品名稱 (去除空白、忽略大小寫)
+        normalized_name = self._normalize_name(product_name)
         
         # 檢查是否有完全匹配
         exact_match = False
         result_products = []
         
         # 如果有完全匹配，直接返回
-        if normalized_name in self.products_name_dict:
-            product = self.products_name_dict[normalized_name]
+        if normalized_name in self._name_index:
+            product = self.products[self._name_index[normalized_name]]
             result_products.append(
                 ProductMatchResult(
                     product_id=product.product_id,
@@ -133,32 +216,28 @@ class ProductService:
             if max_results == 1:
                 return exact_match, result_products
         
-        # 計算所有產品與輸入產品名稱的編輯距離，並按相似度排序
-        match_scores = []
+        # 一次計算輸入名稱與所有產品名稱的相似度（在 rapidfuzz 的 C 實作中完成）
+        # 比較多種相似度計算方法，並取最高分作為最終相似度
+        # 低於閾值的分數不會被採用，以 score_cutoff 讓 rapidfuzz 提早略過這些候選 (結果記為 0)
+        score_cutoff = threshold * 100
+        scores = np.maximum.reduce([
+            process.cdist([normalized_name], self.normalized_names, scorer=scorer, dtype=np.float64, score_cutoff=score_cutoff)[0]
+            for scorer in (fuzz.ratio, fuzz.partial_ratio, fuzz.token_sort_ratio)
+        ]) / 100.0
         
-        for product in self.products:
-            # 使用 rapidfuzz 計算相似度
-            # 比較多種相似度計算方法，並取最高分
-            ratio_score = fuzz.ratio(normalized_name, product.name) / 100.0
-            partial_ratio_score = fuzz.partial_ratio(normalized_name, product.name) / 100.0
-            token_sort_ratio_score = fuzz.token_sort_ratio(normalized_name, product.name) / 100.0
-            
-            # 取最高分作為最終相似度
-            similarity = max(ratio_score, partial_ratio_score, token_sort_ratio_score)
-            
-            # 只保留相似度超過閾值的結果
-            if similarity >= threshold:
-                match_scores.append((product, similarity))
-        
-        # 根據相似度排序 (由高到低)
-        match_scores.sort(key=lambda x: x[1], reverse=True)
+        # 只保留相似度超過閾值的前 max_results 筆，依相似度排序 (由高到低)
+        match_scores = [
+            (i, float(scores[i]))
+            for i in self._top_indices(scores, max_results, threshold)
+        ]
         
         # 轉換為結果格式
-        for product, score in match_scores[:max_results]:
+        for i, score in match_scores:
             # 避免重複添加完全匹配的產品
-            if exact_match and product.name == normalized_name:
+            if exact_match and self.normalized_names[i] == normalized_name:
                 continue
-                
+            
+            product = self.products[i]
             result_products.append(
                 ProductMatchResult(
                     product_id=product.product_id,
@@ -172,6 +251,44 @@ class ProductService:
             )
         
         return exact_match, result_products
+    
+    @staticmethod
+    def _normalize_name(name: str) -> str:
+        """
+        標準化產品名稱：去除前後空白並忽略大小寫
+        
+        Args:
+            name: 產品名稱
+            
+        Returns:
+            str: 標準化後的名稱
+        """
+        return name.strip().casefold()
+    
+    @staticmethod
+    def _top_indices(scores: np.ndarray, k: int, threshold: float) -> List[int]:
+        """
+        找出分數不低於閾值的前 k 個索引，依分數由高到低排序，同分時保持原始順序
+        
+        Args:
+            scores: 每個產品的相似度分數
+            k: 返回的最大數量
+            threshold: 最小相似度閾值
+            
+        Returns:
+            List[int]: 排序後的產品索引
+        """
+        candidates = np.flatnonzero(scores >= threshold)
+        if len(candidates) > k:
+            # 使用 partition 在 O(N) 內找出第 k 高的分數，避免完整排序
+            kth_score = np.partition(scores[candidates], -k)[-k]
+            above = candidates[scores[candidates] > kth_score]
+            ties = candidates[scores[candidates] == kth_score][:k - len(above)]
+            candidates = np.concatenate([above, ties])
+        
+        # 依分數由高到低排序，同分時依原始索引排序
+        order = np.lexsort((candidates, -scores[candidates]))
+        return candidates[order].tolist()
 
 # 創建單例
 product_service = ProductService()
@@ -1,3 +1,4 @@
+import os
 import uvicorn
 from dotenv import load_dotenv
 from invoice_agent.core.config import settings
@@ -14,5 +15,7 @@ if __name__ == "__main__":
         "invoice_agent.main:app",
         host="0.0.0.0",
         port=8008,
-        reload=settings.DEBUG
+        reload=settings.DEBUG,
+        # 正式環境以多個 worker 程序利用多核心；reload 模式只能使用單一程序
+        workers=1 if settings.DEBUG else (settings.WORKERS or os.cpu_count() or 1)
     )
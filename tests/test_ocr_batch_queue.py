@@ -0,0 +1,127 @@
+"""
+OCR 批次佇列測試
+"""
+import asyncio
+
+import pytest
+
+from invoice_agent.services.ocr_batch_queue import AsyncBatchQueue
+
+
+class RecordingHandler:
+    """記錄每個批次內容的批次處理函式"""
+
+    def __init__(self, delay: float = 0.0, error: Exception = None):
+        self.batches = []
+        self.delay = delay
+        self.error = error
+
+    async def __call__(self, requests):
+        self.batches.append(list(requests))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return [f"result-{request}" for request in requests]
+
+
+def test_concurrent_requests_are_coalesced():
+    handler = RecordingHandler()
+
+    async def main():
+        queue = AsyncBatchQueue(handler, max_batch_size=16, max_wait=0.05)
+        results = await asyncio.gather(*(queue.add_request(i) for i in range(5)))
+        await queue.stop()
+        return results
+
+    assert asyncio.run(main()) == [f"result-{i}" for i in range(5)]
+    assert handler.batches == [[0, 1, 2, 3, 4]]
+
+
+def test_batches_are_split_by_count():
+    handler = RecordingHandler()
+
+    async def main():
+        queue = AsyncBatchQueue(handler, max_batch_size=2, max_wait=0.05)
+        results = await queue.add_requests([0, 1, 2, 3, 4])
+        await queue.stop()
+        return results
+
+    assert asyncio.run(main()) == [f"result-{i}" for i in range(5)]
+    assert handler.batches == [[0, 1], [2, 3], [4]]
+
+
+def test_batches_are_split_by_bytes():
+    handler = RecordingHandler()
+
+    async def main():
+        queue = AsyncBatchQueue(handler, max_batch_size=16, max_wait=0.05, max_batch_bytes=10, size_of=len)
+        results = await queue.add_requests(["aaaa", "bbbb", "cccc", "d" * 20, "e"])
+        await queue.stop()
+        return results
+
+    results = asyncio.run(main())
+    assert results == ["result-aaaa", "result-bbbb", "result-cccc", f"result-{'d' * 20}", "result-e"]
+    # 超過上限的單一請求單獨成為一個批次，不影響其他請求
+    assert handler.batches == [["aaaa", "bbbb"], ["cccc"], ["d" * 20], ["e"]]
+
+
+def test_handler_error_is_returned_per_request():
+    handler = RecordingHandler(error=ValueError("boom"))
+
+    async def main():
+        queue = AsyncBatchQueue(handler, max_batch_size=16, max_wait=0.01)
+        results = await queue.add_requests([1, 2])
+        with pytest.raises(ValueError):
+            await queue.add_request(3)
+        await queue.stop()
+        return results
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_stop_fails_partially_collected_batch():
+    handler = RecordingHandler()
+
+    async def main():
+        queue = AsyncBatchQueue(handler, max_batch_size=16, max_wait=10)
+        pending = asyncio.create_task(queue.add_request(1))
+        # 讓背景任務取出請求並進入等待窗口
+        await asyncio.sleep(0.05)
+        await queue.stop()
+        return await asyncio.wait_for(asyncio.gather(pending, return_exceptions=True), timeout=1)
+
+    (result,) = asyncio.run(main())
+    assert isinstance(result, RuntimeError)
+    assert handler.batches == []
+
+
+def test_stop_fails_carried_over_request():
+    handler = RecordingHandler(delay=0.05)
+
+    async def main():
+        queue = AsyncBatchQueue(handler, max_batch_size=16, max_wait=10, max_batch_bytes=4, size_of=len)
+        pending = asyncio.create_task(queue.add_requests(["aaaa", "bbbb"]))
+        await asyncio.sleep(0.05)
+        await queue.stop()
+        return await asyncio.wait_for(pending, timeout=1)
+
+    first, second = asyncio.run(main())
+    assert first == "result-aaaa"
+    # 超出大小上限而留待下一批次的請求在停止時收到錯誤
+    assert isinstance(second, RuntimeError)
+    assert handler.batches == [["aaaa"]]
+
+
+def test_stop_waits_for_dispatched_batches():
+    handler = RecordingHandler(delay=0.05)
+
+    async def main():
+        queue = AsyncBatchQueue(handler, max_batch_size=1, max_wait=0.01)
+        pending = asyncio.create_task(queue.add_request(1))
+        await asyncio.sleep(0.02)
+        await queue.stop()
+        return await asyncio.wait_for(pending, timeout=1)
+
+    assert asyncio.run(main()) == "result-1"
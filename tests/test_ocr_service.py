@@ -0,0 +1,215 @@
+"""
+OCR 服務的重試、限流與快取測試
+"""
+import asyncio
+import hashlib
+import time
+
+import httpx
+import pytest
+from google.api_core import exceptions as google_exceptions
+from google.cloud import vision
+from tenacity import wait_none
+
+from invoice_agent.services import ocr_service as ocr_service_module
+from invoice_agent.services.ocr_service import OCRService
+
+
+class FakeVisionClient:
+    """依序返回預先設定之結果的 Vision 客戶端"""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+        self.options = []
+
+    async def batch_annotate_images(self, requests, **kwargs):
+        self.calls.append(list(requests))
+        self.options.append(kwargs)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return vision.BatchAnnotateImagesResponse(responses=outcome)
+
+
+def _request(content: bytes) -> vision.AnnotateImageRequest:
+    return vision.AnnotateImageRequest(image=vision.Image(content=content))
+
+
+def _text_response(text: str) -> vision.AnnotateImageResponse:
+    return vision.AnnotateImageResponse(
+        text_annotations=[vision.EntityAnnotation(description=text)],
+        full_text_annotation=vision.TextAnnotation(text=text)
+    )
+
+
+def _error_response(code: int) -> vision.AnnotateImageResponse:
+    return vision.AnnotateImageResponse(error={"code": code, "message": "error"})
+
+
+@pytest.fixture
+def service(monkeypatch):
+    # 測試中不實際等待退避時間
+    monkeypatch.setattr(ocr_service_module, "RETRY_WAIT", wait_none())
+    monkeypatch.setattr(OCRService._fetch.retry, "wait", wait_none())
+    service = OCRService()
+    service.vision_min_interval = 0.0
+    return service
+
+
+def test_vision_retries_quota_errors(service):
+    client = FakeVisionClient([
+        google_exceptions.ResourceExhausted("quota"),
+        [_text_response("a")],
+    ])
+    service.vision_client = client
+
+    responses = asyncio.run(service._batch_annotate_images([_request(b"a")]))
+
+    assert len(client.calls) == 2
+    assert responses[0].full_text_annotation.text == "a"
+
+
+def test_vision_call_is_bounded(service):
+    client = FakeVisionClient([
+        google_exceptions.DeadlineExceeded("timeout"),
+        [_text_response("a")],
+    ])
+    service.vision_client = client
+
+    asyncio.run(service._batch_annotate_images([_request(b"a")]))
+
+    # 逾時會重試，且不使用客戶端內建的重試
+    assert len(client.calls) == 2
+    assert client.options[0] == {"retry": None, "timeout": service.vision_request_timeout}
+
+
+def test_vision_resends_only_transient_failures(service):
+    client = FakeVisionClient([
+        [_text_response("a"), _error_response(14), _error_response(3)],
+        [_text_response("b")],
+    ])
+    service.vision_client = client
+    requests = [_request(b"a"), _request(b"b"), _request(b"c")]
+
+    responses = asyncio.run(service._batch_annotate_images(requests))
+
+    assert [len(call) for call in client.calls] == [3, 1]
+    assert client.calls[1][0].image.content == b"b"
+    assert [response.full_text_annotation.text for response in responses[:2]] == ["a", "b"]
+    # 非暫時性錯誤不重試，直接返回錯誤回應
+    assert responses[2].error.code == 3
+
+
+def test_vision_returns_error_responses_after_retries_exhausted(service):
+    client = FakeVisionClient([[_error_response(14)]] * 3)
+    service.vision_client = client
+
+    responses = asyncio.run(service._batch_annotate_images([_request(b"a")]))
+
+    assert len(client.calls) == 3
+    assert responses[0].error.code == 14
+
+
+def test_vision_does_not_retry_permanent_errors(service):
+    client = FakeVisionClient([google_exceptions.InvalidArgument("bad")])
+    service.vision_client = client
+
+    with pytest.raises(google_exceptions.InvalidArgument):
+        asyncio.run(service._batch_annotate_images([_request(b"a")]))
+    assert len(client.calls) == 1
+
+
+def test_vision_calls_are_rate_limited(service):
+    service.vision_min_interval = 0.05
+
+    async def main():
+        started = time.monotonic()
+        await asyncio.gather(*(service._wait_for_rate_limit() for _ in range(3)))
+        return time.monotonic() - started
+
+    # 第一次呼叫立即放行，其後每次間隔至少 vision_min_interval
+    assert asyncio.run(main()) >= 0.1
+
+
+def _mock_http_client(statuses, body: bytes = b"content"):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        status = statuses.pop(0)
+        return httpx.Response(status, content=body if status == 200 else b"")
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler)), calls
+
+
+def test_download_retries_transient_status(service):
+    service.http_client, calls = _mock_http_client([503, 429, 200])
+
+    content, content_hash = asyncio.run(service.download_file("https://example.com/file"))
+
+    assert len(calls) == 3
+    assert content == b"content"
+    assert content_hash == hashlib.sha256(b"content").hexdigest()
+
+
+def test_download_does_not_retry_client_errors(service):
+    service.http_client, calls = _mock_http_client([404])
+
+    with pytest.raises(ValueError):
+        asyncio.run(service.download_file("https://example.com/file"))
+    assert len(calls) == 1
+
+
+PAGE_TEXT = "發票內容 " * 20
+
+
+def _extract_pdf_twice(service, outcomes, pages):
+    """以相同內容的 PDF 呼叫 extract_text 兩次，返回兩次結果及 Vision 客戶端"""
+    client = FakeVisionClient(outcomes)
+    service.vision_client = client
+    service.http_client, _ = _mock_http_client([200, 200], body=b"%PDF-fake")
+
+    async def no_text_layer(pdf_data):
+        return [], False
+
+    service._extract_text_from_pdf = no_text_layer
+    service._render_pdf_pages = lambda pdf_data: pages
+
+    async def main():
+        try:
+            first = await service.extract_text("https://example.com/a.pdf", "application/pdf")
+            second = await service.extract_text("https://example.com/a.pdf", "application/pdf")
+        finally:
+            await service.batch_queue.stop()
+        return first, second
+
+    first, second = asyncio.run(main())
+    return first, second, client
+
+
+def test_pdf_with_failed_page_is_not_cached(service):
+    first, second, client = _extract_pdf_twice(
+        service,
+        [
+            [_text_response(PAGE_TEXT), _error_response(3)],
+            [_text_response(PAGE_TEXT), _text_response(PAGE_TEXT)],
+        ],
+        [b"page-1", b"page-2"],
+    )
+
+    # 第一次有頁面失敗，不快取；第二次重新送出兩頁
+    assert [len(call) for call in client.calls] == [2, 2]
+    assert first["text"] == PAGE_TEXT
+    assert second["text"] == f"{PAGE_TEXT}\n\n{PAGE_TEXT}"
+
+
+def test_successful_pdf_is_cached(service):
+    first, second, client = _extract_pdf_twice(
+        service,
+        [[_text_response(PAGE_TEXT), _text_response(PAGE_TEXT)]],
+        [b"page-1", b"page-2"],
+    )
+
+    assert len(client.calls) == 1
+    assert first["text"] == second["text"] == f"{PAGE_TEXT}\n\n{PAGE_TEXT}"